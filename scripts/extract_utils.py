@@ -7,11 +7,314 @@ Handles various ROM formats: payload.bin, sparse, brotli, etc.
 import os
 import sys
 import json
+import errno
+import io
+import mmap
+import queue
+import shutil
+import stat
 import subprocess
-import struct
-import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List
+
+# Granularity at which all-zero output is turned into holes
+SPARSE_BLOCK_SIZE = 128 * 1024
+
+# Compressed bytes handed to streaming decoders per read
+STREAM_CHUNK_SIZE = 1 << 20
+
+# Matches the largest LZ4 block size so each input chunk covers whole blocks
+LZ4_CHUNK_SIZE = 4 << 20
+
+# Linux ioctl sharing a file's extents with another (btrfs, xfs, bcachefs)
+FICLONE = 0x40049409
+
+
+def _member_relpath(name: str) -> str:
+    """Output path of an archive member, sanitized the way zipfile does it"""
+    return os.sep.join(p for p in name.split('/') if p not in ('', '.', '..'))
+
+
+def _create_tree(base: str, directories: Iterable[str]) -> None:
+    """Create each distinct directory once, parents before children"""
+    for d in sorted(directories, key=len):
+        if d:
+            os.makedirs(os.path.join(base, d), exist_ok=True)
+
+
+def _under_any(path: str, parents) -> bool:
+    """Check whether any ancestor of a relative path is one of parents"""
+    path = os.path.dirname(path)
+    while path:
+        if path in parents:
+            return True
+        path = os.path.dirname(path)
+    return False
+
+
+def _fadvise_sequential(fd: int) -> None:
+    """Hint the kernel to read ahead aggressively on fd, where supported"""
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+
+class _MappedFile(mmap.mmap):
+    """Read-only memory map with the file interface zipfile expects"""
+    
+    def seekable(self) -> bool:
+        return True
+
+
+def _map_file(path) -> _MappedFile:
+    """Map a file read-only, hinting the kernel that access is sequential"""
+    with open(path, 'rb') as f:
+        mm = _MappedFile(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return mm
+
+
+def _is_ext4(path) -> bool:
+    """Check for the ext2/3/4 superblock magic"""
+    with open(path, 'rb') as f:
+        f.seek(1024 + 0x38)
+        return f.read(2) == b'\x53\xef'
+
+
+def _read_chunks(f, size: int = STREAM_CHUNK_SIZE) -> Iterable[bytes]:
+    """Yield successive reads from a file object until EOF"""
+    return iter(lambda: f.read(size), b'')
+
+
+def _mapped_chunks(path, size: int = STREAM_CHUNK_SIZE) -> Iterable[memoryview]:
+    """Yield slices of a read-only mapping of path, without copying them"""
+    if os.path.getsize(path) == 0:
+        return
+    
+    # The mapping is released once the last slice is dropped; closing it
+    # here would fail while a decoder still holds a view into it
+    view = memoryview(_map_file(path))
+    for start in range(0, len(view), size):
+        yield view[start:start + size]
+
+
+def _brotli_chunks(chunks: Iterable[bytes]) -> Iterable[bytes]:
+    """Decode a Brotli stream incrementally"""
+    import brotli
+    
+    decompressor = brotli.Decompressor()
+    
+    # Zero runs expand a chunk by orders of magnitude, so cap each call's
+    # output where the binding allows it (brotli >= 1.2)
+    try:
+        decompressor.process(b'', output_buffer_limit=STREAM_CHUNK_SIZE)
+        limit = {'output_buffer_limit': STREAM_CHUNK_SIZE}
+    except TypeError:
+        limit = {}
+    
+    for chunk in chunks:
+        data = decompressor.process(chunk, **limit)
+        # Output beyond the cap stays buffered in the decoder, even once it
+        # is ready for more input, so drain it with empty input
+        while data:
+            yield data
+            if not limit or decompressor.is_finished():
+                break
+            data = decompressor.process(b'', **limit)
+        
+    if not decompressor.is_finished():
+        raise RuntimeError("Truncated Brotli stream")
+
+
+def _lz4_chunks(chunks: Iterable[bytes]) -> Iterable[bytes]:
+    """Decode a stream of LZ4 frames incrementally"""
+    import lz4.frame
+    
+    context = lz4.frame.create_decompression_context()
+    eof = True
+    
+    for chunk in chunks:
+        while chunk:
+            # Cap the output so a chunk of zero runs cannot balloon in memory
+            data, consumed, eof = lz4.frame.decompress_chunk(
+                context, chunk, max_length=STREAM_CHUNK_SIZE)
+            if data:
+                yield data
+            chunk = chunk[consumed:]
+            if eof:
+                # Images are often written as several concatenated frames
+                context = lz4.frame.create_decompression_context()
+                
+    if not eof:
+        raise RuntimeError("Truncated LZ4 stream")
+
+
+def _zstd_chunks(f) -> Iterable[bytes]:
+    """Decode a stream of Zstandard frames from an open file incrementally"""
+    import zstandard
+    
+    reader = zstandard.ZstdDecompressor().stream_reader(
+        f, read_size=STREAM_CHUNK_SIZE, read_across_frames=True)
+    with reader:
+        yield from iter(lambda: reader.read(STREAM_CHUNK_SIZE), b'')
+
+
+class _ChunkPipe(io.RawIOBase):
+    """Read end of a bounded queue of byte chunks filled by a producer thread"""
+    
+    def __init__(self, maxsize: int = 4):
+        super().__init__()
+        self._queue = queue.Queue(maxsize)
+        self._abandoned = threading.Event()
+        self._chunk = memoryview(b'')
+        self._eof = False
+        
+    def feed(self, chunks: Iterable[bytes]) -> None:
+        """Producer side: queue every chunk, then EOF or the error raised"""
+        try:
+            for chunk in chunks:
+                if chunk and not self._put(chunk):
+                    return
+        except Exception as e:
+            self._put(e)
+        else:
+            self._put(None)
+            
+    def _put(self, item) -> bool:
+        # Give up once the reader has gone away instead of blocking forever
+        while not self._abandoned.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, b) -> int:
+        while not self._chunk:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if item is None:
+                self._eof = True
+            elif isinstance(item, Exception):
+                self._eof = True
+                raise item
+            else:
+                self._chunk = memoryview(item)
+                
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+    
+    def close(self) -> None:
+        self._abandoned.set()
+        super().close()
+
+
+def _write_sparse(dst_path, chunks: Iterable[bytes]) -> int:
+    """Write byte chunks to dst_path, seeking over all-zero blocks"""
+    fd = os.open(dst_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    size = 0
+    
+    try:
+        for chunk in chunks:
+            view = memoryview(chunk)
+            for start in range(0, len(view), SPARSE_BLOCK_SIZE):
+                block = view[start:start + SPARSE_BLOCK_SIZE]
+                if chunk.count(b'\0', start, start + len(block)) == len(block):
+                    os.lseek(fd, len(block), os.SEEK_CUR)
+                    continue
+                while block:
+                    block = block[os.write(fd, block):]
+            size += len(view)
+            
+        # Trailing holes are only materialized by setting the final size
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+        
+    return size
+
+
+def _sparse_copy(src, dst):
+    """Copy a file data segment by data segment, keeping its holes"""
+    # Opening a FIFO would block forever; copy2 rejects special files itself
+    if not stat.S_ISREG(os.stat(src).st_mode):
+        return shutil.copy2(src, dst)
+    if not hasattr(os, 'copy_file_range') or not hasattr(os, 'SEEK_DATA'):
+        return shutil.copy2(src, dst)
+    
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            ifd, ofd = fsrc.fileno(), fdst.fileno()
+            size = os.fstat(ifd).st_size
+            offset = 0
+            
+            while offset < size:
+                try:
+                    start = os.lseek(ifd, offset, os.SEEK_DATA)
+                except OSError as e:
+                    if e.errno != errno.ENXIO:
+                        raise
+                    break  # Only a hole remains
+                end = os.lseek(ifd, start, os.SEEK_HOLE)
+                
+                while start < end:
+                    copied = os.copy_file_range(ifd, ofd, end - start, start, start)
+                    if not copied:
+                        break
+                    start += copied
+                offset = end
+                
+            os.ftruncate(ofd, size)
+    except OSError as e:
+        if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.EXDEV, errno.EOPNOTSUPP):
+            raise
+        return shutil.copy2(src, dst)
+    
+    shutil.copystat(src, dst)
+    return dst
+
+
+def _reflink_or_copy(src, dst):
+    """Clone src into dst by sharing extents, falling back to a sparse copy"""
+    if not stat.S_ISREG(os.stat(src).st_mode):
+        return shutil.copy2(src, dst)
+    
+    try:
+        import fcntl
+    except ImportError:
+        return _sparse_copy(src, dst)
+    
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError as e:
+        # Unsupported by the filesystem, or src and dst are on different ones
+        if e.errno not in (errno.ENOTTY, errno.EXDEV, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOSYS):
+            raise
+        return _sparse_copy(src, dst)
+    
+    shutil.copystat(src, dst)
+    return dst
+
+
+def _merge_tree(src, dst):
+    """Move the contents of src into dst, merging into existing directories"""
+    for entry in os.scandir(src):
+        target = os.path.join(dst, entry.name)
+        if entry.is_dir(follow_symlinks=False) and os.path.isdir(target) and not os.path.islink(target):
+            _merge_tree(entry.path, target)
+        else:
+            os.replace(entry.path, target)
+
 
 class ROMExtractor:
     """Universal ROM extraction handler"""
@@ -21,33 +324,66 @@ class ROMExtractor:
         'tar': ['.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz'],
         'lz4': ['.lz4', '.tar.lz4'],
         'br': ['.br', '.tar.br'],
+        'zstd': ['.zst', '.tar.zst', '.zstd'],
         'sparse': ['.img', '.sparse'],
         'payload': ['payload.bin'],
         'md5': ['.md5'],
     }
     
+    # Formats identified by their first four bytes, read as a little-endian
+    # u32. Brotli has no magic number and is recognized by extension only.
+    MAGIC_FORMATS = {
+        0x04034b50: 'zip',     # PK\x03\x04
+        0x184d2204: 'lz4',
+        0xfd2fb528: 'zstd',
+        0xed26ff3a: 'sparse',  # Android sparse image header
+    }
+    
+    # Magics of other lengths; gzip, xz and bzip2 only ever wrap tarballs
+    MAGIC_PREFIXES = (
+        (b'\x1f\x8b', 'tar'),
+        (b'\xfd7zXZ\x00', 'tar'),
+        (b'BZh', 'tar'),
+    )
+    
+    # Result buckets for extracted files, by exact file name and by suffix
+    CLASSIFY_NAMES = {
+        'build.prop': 'build_props',
+        'default.prop': 'build_props',
+        'prop.default': 'build_props',
+    }
+    CLASSIFY_SUFFIXES = {
+        '.img': 'partition_images',
+        '.rc': 'init_scripts',
+        '.xml': 'xml_configs',
+    }
+    
     def __init__(self, rom_path: str, output_dir: str):
         self.rom_path = Path(rom_path)
         self.output_dir = Path(output_dir)
         self.rom_info = {}
+        self._magic = self._get_magic_bytes() if self.rom_path.is_file() else b''
+        self._fmt = None
         
     def detect_format(self) -> str:
         """Auto-detect ROM format based on magic bytes and extension"""
+        if self._fmt is None:
+            self._fmt = self._detect_format()
+        return self._fmt
+    
+    def _detect_format(self) -> str:
         ext = self.rom_path.suffix.lower()
         name = self.rom_path.name.lower()
         
         # Check magic bytes first
-        magic = self._get_magic_bytes()
-        
-        if magic[:4] == b'PK\x03\x04':
-            return 'zip'
-        elif magic[:4] == b'\x28\xb5\x2f\xfd':
-            return 'br'
-        elif magic[:4] == b'\x04\x22\x4d\x18':
-            return 'lz4'
-        elif magic[:7] == b'\x30\x30\x30\x30\x30\x30\x30':
-            return 'sparse'
-        elif name == 'payload.bin':
+        fmt = self.MAGIC_FORMATS.get(int.from_bytes(self._magic[:4], 'little'))
+        if fmt:
+            return fmt
+        for magic, fmt in self.MAGIC_PREFIXES:
+            if self._magic.startswith(magic):
+                return fmt
+                
+        if name == 'payload.bin':
             return 'payload'
         elif ext in ['.tar', '.gz', '.bz2', '.xz']:
             return 'tar'
@@ -79,6 +415,7 @@ class ROMExtractor:
             'tar': self._extract_tar,
             'lz4': self._extract_lz4,
             'br': self._extract_brotli,
+            'zstd': self._extract_zstd,
             'sparse': self._extract_sparse,
             'payload': self._extract_payload,
             'md5': self._extract_md5,
@@ -89,91 +426,318 @@ class ROMExtractor:
         else:
             raise ValueError(f"Unsupported format: {fmt}")
     
+    def extract_stream(self, fileobj) -> Dict:
+        """Extract ROM read sequentially from a file object named rom_path"""
+        peek = getattr(fileobj, 'peek', None)
+        if peek:
+            self._magic = peek(8)[:8]
+            
+        fmt = self.detect_format()
+        self.rom_info['format'] = fmt
+        self.rom_info['original_path'] = str(self.rom_path)
+        
+        print(f"🔍 Detected format: {fmt} (streaming)")
+        
+        decoders = {
+            'lz4': lambda f: _lz4_chunks(_read_chunks(f, LZ4_CHUNK_SIZE)),
+            'br': lambda f: _brotli_chunks(_read_chunks(f)),
+            'zstd': _zstd_chunks,
+        }
+        
+        # A tar.md5 is a tar with the checksum appended after its end marker
+        if fmt in ('tar', 'md5'):
+            return self._extract_tar_stream(fileobj)
+        elif fmt in decoders:
+            return self._extract_decoded(decoders[fmt](fileobj))
+        
+        # Everything else needs random access, so spool it to disk first
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        spool_path = self.output_dir / self.rom_path.name
+        
+        with open(spool_path, 'wb') as f:
+            shutil.copyfileobj(fileobj, f, STREAM_CHUNK_SIZE)
+            
+        try:
+            return ROMExtractor(str(spool_path), str(self.output_dir)).extract()
+        finally:
+            spool_path.unlink()
+    
     def _extract_zip(self) -> Dict:
         """Extract ZIP archive"""
         import zipfile
         
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        base = os.path.join(os.path.abspath(self.output_dir), '')
         
-        with zipfile.ZipFile(self.rom_path, 'r') as zf:
-            # Check for nested archives
-            nested = [f for f in zf.namelist() if f.endswith(('.zip', '.tar', '.md5', '.lz4'))]
-            
-            print(f"📦 Extracting {len(zf.namelist())} files...")
-            zf.extractall(self.output_dir)
+        files, directories, nested, members = [], set(), [], []
+        
+        # Archives are read through a memory map so zlib inflates straight
+        # from the page cache instead of from copies in a read buffer
+        with _map_file(self.rom_path) as mm, zipfile.ZipFile(mm, 'r') as zf:
+            infos = zf.infolist()
+        
+        print(f"📦 Extracting {len(infos)} files...")
+        
+        # Single pass over the central directory to classify each member,
+        # so the output tree never has to be re-walked
+        for info in infos:
+            rel_path = _member_relpath(info.filename)
+            if not rel_path:
+                continue
             
-            # Handle nested archives recursively
-            for nest in nested:
-                nest_path = self.output_dir / nest
-                if nest_path.exists():
+            if info.is_dir():
+                parent = rel_path
+            else:
+                if info.filename.endswith(('.zip', '.tar', '.md5', '.lz4')):
+                    nested.append((info, rel_path))
+                else:
+                    files.append(rel_path)
+                    members.append((info, base + rel_path))
+                parent = os.path.dirname(rel_path)
+                
+            while parent and parent not in directories:
+                directories.add(parent)
+                parent = os.path.dirname(parent)
+        
+        # Create the tree up front, once per distinct directory, so extraction
+        # workers neither race on mkdir nor repeat it for every member
+        _create_tree(base, directories)
+        
+        # Members are compressed independently, so inflate them in parallel,
+        # each worker thread reading through its own mapping and ZipFile
+        local = threading.local()
+        handles = []
+        
+        def _extract_one(item):
+            info, path = item
+            zf = getattr(local, 'zf', None)
+            if zf is None:
+                mm = _map_file(self.rom_path)
+                zf = local.zf = zipfile.ZipFile(mm, 'r')
+                handles.append((zf, mm))
+            # Parents already exist, so skip ZipFile.extract's per-member checks
+            with zf.open(info) as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, STREAM_CHUNK_SIZE)
+        
+        try:
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+                list(ex.map(_extract_one, members))
+        finally:
+            for zf, mm in handles:
+                zf.close()
+                mm.close()
+        
+        # Handle nested archives recursively, streaming each one straight out
+        # of the outer archive instead of writing it out and reading it back
+        if nested:
+            with _map_file(self.rom_path) as mm, zipfile.ZipFile(mm, 'r') as zf:
+                for info, nest in nested:
                     print(f"🔓 Extracting nested: {nest}")
-                    sub_ext = ROMExtractor(str(nest_path), str(self.output_dir / 'nested'))
-                    sub_ext.extract()
-                    nest_path.unlink()  # Remove nested archive after extraction
+                    with zf.open(info) as nfp:
+                        sub_ext = ROMExtractor(str(self.output_dir / nest), str(self.output_dir / 'nested'))
+                        sub_result = sub_ext.extract_stream(nfp)
+                    
+                    directories.add('nested')
+                    files.extend(os.path.join('nested', f) for f in sub_result.get('files', []))
+                    directories.update(os.path.join('nested', d) for d in sub_result.get('directories', []))
         
-        return self._scan_output()
+        # Nested extractors share one output directory and may report overlapping trees
+        return self._build_result(list(dict.fromkeys(files)), sorted(directories))
     
     def _extract_tar(self) -> Dict:
         """Extract TAR archive"""
         import tarfile
         
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        base = os.path.abspath(self.output_dir)
         
-        with tarfile.open(self.rom_path, 'r:*') as tf:
-            print(f"📦 Extracting {len(tf.getmembers())} files...")
-            tf.extractall(self.output_dir)
+        # Member data is read by offset, which needs an uncompressed archive
+        tar_path = self._decompress_tar()
+        
+        try:
+            with tarfile.open(tar_path, 'r:') as tf:
+                members = tf.getmembers()
+                print(f"📦 Extracting {len(members)} files...")
+                
+                regular, special, dir_members, directories = [], [], [], set()
+                paths, links = [], set()
+                for member in members:
+                    rel_path = _member_relpath(member.name)
+                    if not rel_path:
+                        continue
+                    paths.append(rel_path)
+                    if member.issym() or member.islnk():
+                        links.add(rel_path)
+                    if member.isdir():
+                        dir_members.append((member, os.path.join(base, rel_path)))
+                        directories.add(rel_path)
+                        continue
+                    if member.isreg() and not member.issparse():
+                        regular.append((member, os.path.join(base, rel_path)))
+                    else:
+                        special.append(member)
+                    directories.add(os.path.dirname(rel_path))
+                
+                # Members beneath a linked directory (lib -> usr/lib, lib/foo)
+                # only land where the link points when extracted in order
+                if links and any(_under_any(path, links) for path in paths):
+                    print("🔗 Archive nests entries under links, extracting serially...")
+                    tf.extractall(base)
+                    return self._scan_output()
+                
+                # Create the tree serially before the parallel data phase
+                _create_tree(base, directories)
+                
+                fd = os.open(tar_path, os.O_RDONLY)
+                
+                def _extract_one(item):
+                    member, path = item
+                    offset, remaining = member.offset_data, member.size
+                    with open(path, 'wb') as out:
+                        while remaining:
+                            data = os.pread(fd, min(remaining, 8 << 20), offset)
+                            if not data:
+                                raise tarfile.ReadError(f"Unexpected end of data in {member.name}")
+                            out.write(data)
+                            offset += len(data)
+                            remaining -= len(data)
+                    tf.chown(member, path, False)
+                    tf.chmod(member, path)
+                    tf.utime(member, path)
+                
+                try:
+                    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+                        list(ex.map(_extract_one, regular))
+                finally:
+                    os.close(fd)
+                
+                # Links may point at regular files, so they go last
+                for member in special:
+                    tf.extract(member, base)
+                
+                # Directory attributes go on last, deepest first as extractall
+                # does, so read-only directories were still writable above
+                dir_members.sort(key=lambda item: item[1], reverse=True)
+                for member, path in dir_members:
+                    tf.chown(member, path, False)
+                    tf.utime(member, path)
+                    tf.chmod(member, path)
+        finally:
+            if tar_path != self.rom_path:
+                tar_path.unlink()
             
         return self._scan_output()
     
-    def _extract_lz4(self) -> Dict:
-        """Extract LZ4 compressed file"""
-        import lz4.frame
-        
-        output_file = self.output_dir / self.rom_path.stem
+    def _decompress_tar(self) -> Path:
+        """Return an uncompressed copy of the tar, or the ROM itself if it is plain"""
+        import bz2
+        import gzip
+        import lzma
+        import tempfile
+        
+        magic = self._magic
+        
+        # Multi-threaded decompressors are preferred over the stdlib codecs,
+        # which decode on a single core
+        if magic[:2] == b'\x1f\x8b':
+            tool, opener = ['pigz', '-dc'], gzip.open
+        elif magic[:3] == b'BZh':
+            tool, opener = ['pbzip2', '-dc'], bz2.open
+        elif magic[:6] == b'\xfd7zXZ\x00':
+            tool, opener = ['pixz', '-d'], lzma.open
+        else:
+            return self.rom_path
+        
+        exe = shutil.which(tool[0])
+        
+        print(f"🔓 Decompressing {self.rom_path.name} with {tool[0] if exe else 'Python'}...")
+        
+        with tempfile.NamedTemporaryFile(dir=self.output_dir, suffix='.tar', delete=False) as dst:
+            try:
+                if exe:
+                    with open(self.rom_path, 'rb') as src:
+                        result = subprocess.run(
+                            [exe] + tool[1:],
+                            stdin=src,
+                            stdout=dst,
+                            stderr=subprocess.PIPE,
+                            text=True
+                        )
+                    if result.returncode != 0:
+                        raise RuntimeError(f"{tool[0]} failed: {result.stderr}")
+                else:
+                    with opener(self.rom_path, 'rb') as src:
+                        shutil.copyfileobj(src, dst, 8 << 20)
+            except BaseException:
+                os.unlink(dst.name)
+                raise
+            
+        return Path(dst.name)
+    
+    def _extract_tar_stream(self, fileobj) -> Dict:
+        """Extract TAR archive from a non-seekable stream"""
+        import tarfile
         
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
-        with open(self.rom_path, 'rb') as f:
-            compressed = f.read()
-        
-        decompressed = lz4.frame.decompress(compressed)
-        
-        with open(output_file, 'wb') as f:
-            f.write(decompressed)
-            
-        print(f"🔓 Decompressed: {output_file}")
-        
-        # If result is tar, extract it
-        if output_file.suffix in ['.tar']:
-            sub_ext = ROMExtractor(str(output_file), str(self.output_dir))
-            sub_ext.extract()
-            output_file.unlink()
+        def _clear_links(tf):
+            # Hardlinking onto an existing path makes tarfile fall back to
+            # re-reading the target's data, which a stream cannot seek back to
+            for member in tf:
+                if member.islnk():
+                    target = os.path.join(self.output_dir, member.name)
+                    if os.path.islink(target) or os.path.isfile(target):
+                        os.unlink(target)
+                yield member
+        
+        with tarfile.open(fileobj=fileobj, mode='r|*') as tf:
+            tf.extractall(self.output_dir, members=_clear_links(tf))
             
         return self._scan_output()
     
+    def _extract_lz4(self) -> Dict:
+        """Extract LZ4 compressed file"""
+        # Decode straight from the page cache rather than from read() copies
+        return self._extract_decoded(_lz4_chunks(_mapped_chunks(self.rom_path, LZ4_CHUNK_SIZE)))
+    
     def _extract_brotli(self) -> Dict:
         """Extract Brotli compressed file"""
-        import brotli
-        
+        return self._extract_decoded(_brotli_chunks(_mapped_chunks(self.rom_path)))
+    
+    def _extract_zstd(self) -> Dict:
+        """Extract Zstandard compressed file"""
+        with open(self.rom_path, 'rb') as f:
+            _fadvise_sequential(f.fileno())
+            return self._extract_decoded(_zstd_chunks(f))
+    
+    def _extract_decoded(self, chunks: Iterable[bytes]) -> Dict:
+        """Write out a decoder's output, or stream it into a nested extractor"""
         output_file = self.output_dir / self.rom_path.stem
         
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
-        with open(self.rom_path, 'rb') as f:
-            compressed = f.read()
+        if output_file.suffix not in ['.tar', '.zip', '.lz4']:
+            _write_sparse(output_file, chunks)
+            print(f"🔓 Decompressed: {output_file}")
+            return self._scan_output()
         
-        decompressed = brotli.decompress(compressed)
+        # Nested archive: decode on a producer thread while the nested
+        # extractor consumes, instead of materializing it on disk in between
+        print(f"🔓 Streaming nested: {output_file.name}")
         
-        with open(output_file, 'wb') as f:
-            f.write(decompressed)
-            
-        print(f"🔓 Decompressed: {output_file}")
+        pipe = _ChunkPipe()
+        producer = threading.Thread(target=pipe.feed, args=(chunks,), daemon=True)
+        producer.start()
         
-        # Handle nested archives
-        if output_file.suffix in ['.tar', '.zip', '.lz4']:
-            sub_ext = ROMExtractor(str(output_file), str(self.output_dir))
-            sub_ext.extract()
-            output_file.unlink()
+        try:
+            with io.BufferedReader(pipe, STREAM_CHUNK_SIZE) as stream:
+                ROMExtractor(str(output_file), str(self.output_dir)).extract_stream(stream)
+                # Decode any trailing padding so truncated input still fails
+                while stream.read(STREAM_CHUNK_SIZE):
+                    pass
+        finally:
+            pipe.close()
+            producer.join()
             
         return self._scan_output()
     
@@ -202,6 +766,37 @@ class ROMExtractor:
     
     def _extract_ext4(self, img_path: Path) -> None:
         """Extract ext4 image contents"""
+        # debugfs reads the filesystem in userspace: no loop mount, no sudo.
+        # It exits 0 even when it cannot open the image, hence the magic check.
+        debugfs = shutil.which('debugfs')
+        if debugfs and _is_ext4(img_path):
+            import tempfile
+            
+            # rdump refuses to write into existing directories, so dump into a
+            # fresh one and merge. Running there also keeps the output path out
+            # of debugfs' quoted request syntax.
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            dump_dir = tempfile.mkdtemp(dir=self.output_dir, prefix='.ext4-')
+            try:
+                result = subprocess.run(
+                    [debugfs, '-R', 'rdump / .', str(img_path.resolve())],
+                    cwd=dump_dir,
+                    capture_output=True,
+                    text=True
+                )
+                
+                # Failed dumps still exit 0, report them on stderr only
+                errors = [line for line in result.stderr.splitlines() if line.startswith('rdump:')]
+                if result.returncode != 0 or errors:
+                    raise RuntimeError(f"debugfs failed: {result.stderr}")
+                    
+                _merge_tree(dump_dir, self.output_dir)
+            finally:
+                shutil.rmtree(dump_dir, ignore_errors=True)
+                
+            print(f"📂 Dumped ext4 contents: {img_path.name}")
+            return
+        
         mount_point = self.output_dir / 'mounted'
         mount_point.mkdir(parents=True, exist_ok=True)
         
@@ -212,14 +807,14 @@ class ROMExtractor:
                 check=False
             )
             
-            # Copy contents
-            import shutil
+            # Copy contents, cloning extents where the filesystems allow it
+            # and otherwise keeping the holes in sparse files
             for item in mount_point.iterdir():
                 dest = self.output_dir / item.name
                 if item.is_dir():
-                    shutil.copytree(item, dest, dirs_exist_ok=True)
+                    shutil.copytree(item, dest, dirs_exist_ok=True, copy_function=_reflink_or_copy)
                 else:
-                    shutil.copy2(item, dest)
+                    _reflink_or_copy(item, dest)
                     
         finally:
             # Cleanup
@@ -228,10 +823,32 @@ class ROMExtractor:
     
     def _extract_payload(self) -> Dict:
         """Extract payload.bin (A/B OTA)"""
-        # Use external payload dumper or aospdtgen's built-in handling
-        # This is handled by dumpyara usually
-        print("⚠️ payload.bin detected, delegating to dumpyara...")
-        return {'format': 'payload', 'delegated': True}
+        import importlib.util
+        
+        # payload-dumper-go decodes partitions concurrently in native code,
+        # the pure Python payload_dumper is only a fallback
+        tool = 'payload-dumper-go'
+        dumper = shutil.which(tool)
+        if dumper:
+            cmd = [dumper, '-o', str(self.output_dir), '-c', str(os.cpu_count() or 1), str(self.rom_path)]
+        elif importlib.util.find_spec('payload_dumper'):
+            tool = 'payload_dumper'
+            cmd = [sys.executable, '-m', 'payload_dumper', '--out', str(self.output_dir), str(self.rom_path)]
+        else:
+            # This is handled by dumpyara usually
+            print("⚠️ payload.bin detected, delegating to dumpyara...")
+            return {'format': 'payload', 'delegated': True}
+        
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        
+        print(f"📤 Dumping partitions with {tool}...")
+        
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        
+        if result.returncode != 0:
+            raise RuntimeError(f"{tool} failed: {result.stderr}")
+            
+        return self._scan_output()
     
     def _extract_md5(self) -> Dict:
         """Handle MD5 checksum files (usually tar.md5)"""
@@ -245,35 +862,66 @@ class ROMExtractor:
     
     def _scan_output(self) -> Dict:
         """Scan output directory and return structure info"""
+        files, directories = [], []
+        add_file, add_dir = files.append, directories.append
+        
+        # Entry paths all start with the output directory, so relative
+        # paths are plain slices rather than Path.relative_to calls
+        base = os.path.join(str(self.output_dir), '')
+        baselen = len(base)
+        stack = [base]
+        
+        # Explicit scandir walk: DirEntry carries the file type from the
+        # directory read
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    full = entry.path
+                    if entry.is_dir(follow_symlinks=False):
+                        add_dir(full[baselen:])
+                        stack.append(full)
+                    else:
+                        add_file(full[baselen:])
+        
+        return self._build_result(files, directories)
+    
+    def _build_result(self, files: List[str], directories: List[str]) -> Dict:
+        """Classify extracted paths and write the extraction metadata"""
         result = {
             'format': self.rom_info.get('format'),
             'output_dir': str(self.output_dir),
-            'files': [],
-            'directories': [],
+            'files': files,
+            'directories': directories,
             'build_props': [],
-            'partition_images': []
+            'partition_images': [],
+            'init_scripts': [],
+            'xml_configs': []
         }
         
-        for root, dirs, files in os.walk(self.output_dir):
-            for f in files:
-                fpath = Path(root) / f
-                rel_path = fpath.relative_to(self.output_dir)
-                result['files'].append(str(rel_path))
-                
-                if f == 'build.prop':
-                    result['build_props'].append(str(rel_path))
-                elif f.endswith('.img'):
-                    result['partition_images'].append(str(rel_path))
-                    
-            for d in dirs:
-                dpath = Path(root) / d
-                rel_path = dpath.relative_to(self.output_dir)
-                result['directories'].append(str(rel_path))
-        
-        # Save metadata
+        # Dict lookups and a tuple endswith keep the per-file work in C
+        names = self.CLASSIFY_NAMES
+        suffix_buckets = self.CLASSIFY_SUFFIXES
+        suffixes = tuple(suffix_buckets)
+        sep = os.sep
+        
+        for rel_path in files:
+            name = rel_path.rpartition(sep)[2]
+            bucket = names.get(name)
+            if bucket:
+                result[bucket].append(rel_path)
+            elif name.endswith(suffixes):
+                result[suffix_buckets[name[name.rfind('.'):]]].append(rel_path)
+        
+        # Save metadata compactly, it is only ever read back by tools
         metadata_file = self.output_dir / 'extraction_metadata.json'
-        with open(metadata_file, 'w') as f:
-            json.dump(result, f, indent=2)
+        try:
+            import orjson
+        except ImportError:
+            with open(metadata_file, 'w') as f:
+                json.dump(result, f, separators=(',', ':'))
+        else:
+            with open(metadata_file, 'wb') as f:
+                f.write(orjson.dumps(result))
         
         return result
 
@@ -0,0 +1,121 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'scripts'))
+
+import extract_utils
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    os.urandom(3 << 20),
+    b'\0' * (8 << 20),
+    (b'ro.build.fingerprint=test\n' * 100000 + os.urandom(1000)) * 3,
+], ids=['empty', 'random', 'zeros', 'mixed'])
+def test_brotli_round_trip(tmp_path, data):
+    brotli = pytest.importorskip('brotli')
+    
+    rom = tmp_path / 'system.new.dat.br'
+    rom.write_bytes(brotli.compress(data))
+    
+    result = extract_utils.ROMExtractor(str(rom), str(tmp_path / 'out')).extract()
+    
+    assert (tmp_path / 'out' / 'system.new.dat').read_bytes() == data
+    assert 'system.new.dat' in result['files']
+
+
+def test_brotli_truncated(tmp_path):
+    brotli = pytest.importorskip('brotli')
+    
+    rom = tmp_path / 'system.new.dat.br'
+    rom.write_bytes(brotli.compress(os.urandom(100000))[:-5])
+    
+    with pytest.raises(RuntimeError, match='Truncated Brotli stream'):
+        extract_utils.ROMExtractor(str(rom), str(tmp_path / 'out')).extract()
+
+
+def test_ext4_dump_merges_into_existing_output(tmp_path):
+    mke2fs = shutil.which('mke2fs')
+    if not mke2fs or not shutil.which('debugfs'):
+        pytest.skip('e2fsprogs not installed')
+        
+    root = tmp_path / 'root'
+    (root / 'etc').mkdir(parents=True)
+    (root / 'etc' / 'init.rc').write_text('on boot\n')
+    (root / 'build.prop').write_text('ro.build.id=new\n')
+    
+    img = tmp_path / 'system.img'
+    subprocess.run([mke2fs, '-q', '-F', '-t', 'ext4', '-d', str(root), str(img), '4M'], check=True)
+    
+    out = tmp_path / 'o"ut'
+    (out / 'etc').mkdir(parents=True)
+    (out / 'etc' / 'keep').write_text('keep\n')
+    (out / 'build.prop').write_text('ro.build.id=old\n')
+    
+    extract_utils.ROMExtractor(str(img), str(out))._extract_ext4(img)
+    
+    assert (out / 'etc' / 'init.rc').read_text() == 'on boot\n'
+    assert (out / 'etc' / 'keep').read_text() == 'keep\n'
+    assert (out / 'build.prop').read_text() == 'ro.build.id=new\n'
+    assert not [name for name in os.listdir(out) if name.startswith('.ext4-')]
+
+
+def test_tar_entries_under_symlinked_directory(tmp_path):
+    rom = tmp_path / 'rom.tar'
+    with tarfile.open(rom, 'w') as tf:
+        usr_lib = tarfile.TarInfo('usr/lib')
+        usr_lib.type = tarfile.DIRTYPE
+        usr_lib.mode = 0o755
+        tf.addfile(usr_lib)
+        
+        lib = tarfile.TarInfo('lib')
+        lib.type = tarfile.SYMTYPE
+        lib.linkname = 'usr/lib'
+        tf.addfile(lib)
+        
+        data = b'\x7fELF'
+        foo = tarfile.TarInfo('lib/foo')
+        foo.size = len(data)
+        tf.addfile(foo, io.BytesIO(data))
+        
+    out = tmp_path / 'out'
+    extract_utils.ROMExtractor(str(rom), str(out)).extract()
+    
+    assert os.readlink(out / 'lib') == 'usr/lib'
+    assert (out / 'usr' / 'lib' / 'foo').read_bytes() == b'\x7fELF'
+
+
+def test_nested_tar_hardlinks_over_existing_files(tmp_path):
+    def _tar_with_hardlink():
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tf:
+            data = b'hello'
+            target = tarfile.TarInfo('bin/a')
+            target.size = len(data)
+            tf.addfile(target, io.BytesIO(data))
+            
+            link = tarfile.TarInfo('bin/b')
+            link.type = tarfile.LNKTYPE
+            link.linkname = 'bin/a'
+            tf.addfile(link)
+        return buf.getvalue()
+    
+    rom = tmp_path / 'rom.zip'
+    with zipfile.ZipFile(rom, 'w') as zf:
+        zf.writestr('one.tar', _tar_with_hardlink())
+        zf.writestr('two.tar', _tar_with_hardlink())
+        
+    out = tmp_path / 'out'
+    # The second run extracts over the output of the first
+    for _ in range(2):
+        extract_utils.ROMExtractor(str(rom), str(out)).extract()
+        
+    assert (out / 'nested' / 'bin' / 'b').read_bytes() == b'hello'
+    assert os.path.samefile(out / 'nested' / 'bin' / 'a', out / 'nested' / 'bin' / 'b')